@@ -2,7 +2,8 @@
 
 __all__ = ('is_mne_installed', 'is_nibabel_installed', 'is_opengl_installed',
            'is_pandas_installed', 'is_lspopt_installed', 'is_xlrd_installed',
-           'is_tensorpac_installed', 'is_sc_image_installed')
+           'is_tensorpac_installed', 'is_sc_image_installed',
+           'is_numba_installed')
 
 
 def _check_version(v_user, v_compare):
@@ -119,6 +120,20 @@ def is_xlrd_installed(raise_error=False):
     return is_installed
 
 
+def is_numba_installed(raise_error=False):
+    """Test if numba is installed."""
+    try:
+        import numba  # noqa
+        is_installed = True
+    except:
+        is_installed = False
+    # Raise error (if needed) :
+    if raise_error and not is_installed:
+        raise IOError("numba not installed. In a terminal, run : pip install "
+                      "numba")
+    return is_installed
+
+
 def is_sc_image_installed(raise_error=False):
     """Test if scikit-image is installed."""
     try:
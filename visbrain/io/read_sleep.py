@@ -14,9 +14,10 @@ import logging
 import datetime
 
 import numpy as np
+from scipy.signal import resample_poly
 from scipy.stats import iqr
 
-from visbrain.io.dependencies import is_mne_installed
+from visbrain.io.dependencies import is_mne_installed, is_numba_installed
 from visbrain.io.dialog import dialog_load
 from visbrain.io.mneio import mne_switch
 from visbrain.io.rw_hypno import (read_hypno, oversample_hypno)
@@ -209,7 +210,7 @@ class ReadSleepData(object):
         PROFILER("Check data", level=1)
 
 
-def sleep_switch(file, ext, downsample):
+def sleep_switch(file, ext, downsample, t_start=0., t_stop=None):
     """Switch between sleep data files.
 
     Parameters
@@ -220,6 +221,11 @@ def sleep_switch(file, ext, downsample):
         Extension name (e.g. '.eeg')
     downsample : int
         Down-sampling frequency.
+    t_start : float | 0.
+        Starting time (in seconds) of the data to load.
+    t_stop : float | None
+        Ending time (in seconds) of the data to load. The default is to
+        load up to the end of the recording.
 
     Returns
     -------
@@ -244,16 +250,16 @@ def sleep_switch(file, ext, downsample):
     path = file + ext
 
     if ext == '.vhdr':  # BrainVision
-        return read_bva(path, downsample)
+        return read_bva(path, downsample, t_start=t_start, t_stop=t_stop)
 
     if ext == '.eeg':  # Elan
-        return read_elan(path, downsample)
+        return read_elan(path, downsample, t_start=t_start, t_stop=t_stop)
 
     elif ext in ['.edf', '.rec']:  # European Data Format
-        return read_edf(path, downsample)
+        return read_edf(path, downsample, t_start=t_start, t_stop=t_stop)
 
     elif ext == '.trc':  # Micromed
-        return read_trc(path, downsample)
+        return read_trc(path, downsample, t_start=t_start, t_stop=t_stop)
 
     else:  # None
         raise ValueError("*" + ext + " files are currently not supported.")
@@ -265,7 +271,106 @@ def sleep_switch(file, ext, downsample):
 ###############################################################################
 ###############################################################################
 
-def read_edf(path, downsample):
+def _sample_bounds(sf, n_samples, t_start, t_stop):
+    """Convert a (t_start, t_stop) window in seconds into sample bounds.
+
+    Parameters
+    ----------
+    sf : float
+        The sampling frequency.
+    n_samples : int
+        Total number of samples in the recording.
+    t_start : float
+        Starting time (in seconds) of the window.
+    t_stop : float | None
+        Ending time (in seconds) of the window. None loads up to the end
+        of the recording.
+
+    Returns
+    -------
+    sample_start : int
+        Index of the first sample to load.
+    sample_stop : int
+        Index of the last sample to load.
+    """
+    sample_start = min(max(int(t_start * sf), 0), n_samples)
+    sample_stop = n_samples if t_stop is None else \
+        min(max(int(t_stop * sf), sample_start), n_samples)
+    return sample_start, sample_stop
+
+
+_gain_kernel = None
+
+
+def _get_gain_kernel():
+    """Compile (once) the parallel Numba gain kernel."""
+    global _gain_kernel
+    if _gain_kernel is None:
+        from numba import njit, prange
+
+        @njit(parallel=True, fastmath=True, nogil=True)
+        def _kernel(raw, ground, gain, out):  # pragma: no cover
+            for c in prange(raw.shape[0]):
+                g = gain[c]
+                b = ground[c]
+                for t in range(raw.shape[1]):
+                    out[c, t] = (raw[c, t] - b) * g
+
+        _gain_kernel = _kernel
+    return _gain_kernel
+
+
+def _apply_gain(raw, gain, ground=None, dsf=1):
+    """Convert raw integer samples into gain-scaled float32 data.
+
+    The subtract / multiply / cast steps are fused into a single pass
+    over the raw array, parallelized across channels when Numba is
+    installed.
+
+    Parameters
+    ----------
+    raw : array_like
+        Raw data of shape (n_channels, n_points). Can be a (strided view
+        of a) memmap : each channel is only read once.
+    gain : array_like
+        Per-channel multiplicative gain of shape (n_channels,).
+    ground : array_like | None
+        Per-channel logical ground to subtract before applying the gain.
+    dsf : int | 1
+        Down-sampling factor. When greater than 1, every channel goes
+        through an anti-aliased polyphase FIR decimation
+        (scipy.signal.resample_poly) instead of naked subsampling.
+
+    Returns
+    -------
+    data : array_like
+        Scaled float32 data of shape (n_channels, ceil(n_points / dsf)).
+    """
+    n_chan, n_pts = raw.shape
+    gain = np.asarray(gain, dtype=np.float64)
+    ground_arr = np.zeros(n_chan, dtype=np.float64) if ground is None else \
+        np.asarray(ground, dtype=np.float64)
+    if dsf > 1:
+        # Decimate channel-wise so that only one full-rate float copy
+        # lives at a time :
+        data = np.empty((n_chan, -(-n_pts // dsf)), dtype=np.float32)
+        for c in range(n_chan):
+            x = raw[c] if ground is None else raw[c] - ground_arr[c]
+            np.multiply(resample_poly(x, 1, dsf), gain[c], out=data[c],
+                        dtype=np.float32)
+        return data
+    data = np.empty(raw.shape, dtype=np.float32)
+    # Numba doesn't support non-native byte orders (e.g. big-endian ELAN)
+    if is_numba_installed() and raw.dtype.isnative:
+        _get_gain_kernel()(np.asarray(raw), ground_arr, gain, data)
+    else:
+        for c in range(n_chan):
+            x = raw[c] if ground is None else raw[c] - ground_arr[c]
+            np.multiply(x, gain[c], out=data[c], dtype=np.float32)
+    return data
+
+
+def read_edf(path, downsample, t_start=0., t_stop=None):
     """Read data from a European Data Format (edf) file.
 
     Use phypno class for reading EDF files:
@@ -277,6 +382,10 @@ def read_edf(path, downsample):
         Filename(with full path) to EDF file
     downsample : int
         Down-sampling frequency.
+    t_start : float | 0.
+        Starting time (in seconds) of the data to load.
+    t_stop : float | None
+        Ending time (in seconds) of the data to load.
 
     Returns
     -------
@@ -312,22 +421,36 @@ def read_edf(path, downsample):
         bad_chans = np.where(edf.hdr['n_samples_per_record'] < sf)
         chan = np.delete(chan, bad_chans)
 
-    # Load all samples of selected channels
-    np.seterr(divide='ignore', invalid='ignore')
-    data = edf.return_dat(chan, 0, n_samples)
+    # Get the requested time window :
+    sample_start, sample_stop = _sample_bounds(sf, n_samples, t_start, t_stop)
 
     # Get original signal length :
-    n = data.shape[1]
+    n = sample_stop - sample_start
 
     # Get down-sample factor :
     sf = float(sf)
     chan = list(chan)
     dsf, downsample = get_dsf(downsample, sf)
 
-    return sf, downsample, dsf, data[:, ::dsf], chan, n, start_time, None
+    # Load one channel at a time and decimate it (with anti-alias
+    # filtering) before reading the next one, so that peak memory stays
+    # at a single full-rate channel instead of the whole recording.
+    # Calibration mirrors Edf.return_dat, which only works on the full
+    # channel list at once :
+    np.seterr(divide='ignore', invalid='ignore')
+    hdr = edf.hdr
+    gain = (hdr['physical_max'] - hdr['physical_min']) / \
+        (hdr['digital_max'] - hdr['digital_min'])
+    data = np.empty((len(chan), -(-n // dsf)), dtype=np.float32)
+    for i in range(len(chan)):
+        x = edf._read_dat(i, sample_start, sample_stop).astype(np.float64)
+        x = (x - hdr['digital_min'][i]) * gain[i] + hdr['physical_min'][i]
+        data[i] = resample_poly(x, 1, dsf) if dsf > 1 else x
+
+    return sf, downsample, dsf, data, chan, n, start_time, None
 
 
-def read_trc(path, downsample):
+def read_trc(path, downsample, t_start=0., t_stop=None):
     """Read data from a Micromed (trc) file (version 4).
 
     Poor man's version of micromedio.py from Neo package
@@ -339,6 +462,10 @@ def read_trc(path, downsample):
         Filename(with full path) to .trc file
     downsample : int
         Down-sampling frequency.
+    t_start : float | 0.
+        Starting time (in seconds) of the data to load.
+    t_stop : float | None
+        Ending time (in seconds) of the data to load.
 
     Returns
     -------
@@ -375,17 +502,17 @@ def read_trc(path, downsample):
         day, month, year, hour, minute, sec = read_f(f, 'bbbbbb')
         start_time = datetime.time(hour, minute, sec)
 
-        # Raw data
-        f.seek(data_start_offset, 0)
-        m_raw = np.fromstring(f.read(), dtype='u' + str(nbytes))
+        # Raw data : seek to the requested window and read only that slice
+        n_samples = int((os.path.getsize(path) - data_start_offset) /
+                        (nbytes * n_chan))
+        sample_start, sample_stop = _sample_bounds(sf, n_samples, t_start,
+                                                   t_stop)
+        f.seek(data_start_offset + sample_start * n_chan * nbytes, 0)
+        m_raw = np.fromfile(f, dtype='u' + str(nbytes),
+                            count=(sample_stop - sample_start) * n_chan)
         m_raw = m_raw.reshape((int(m_raw.size / n_chan), n_chan)).transpose()
 
         # Read label / gain
-        gain = []
-        chan = []
-        logical_ground = []
-        data = np.empty(shape=m_raw.shape, dtype=np.float32)
-
         f.seek(176, 0)
         zone_names = ['ORDER', 'LABCOD']
         zones = {}
@@ -397,35 +524,39 @@ def read_trc(path, downsample):
         f.seek(pos, 0)
         code = np.fromfile(f, dtype='u2', count=n_chan)
 
-        for c in range(n_chan):
-            zname2, pos, length = zones['LABCOD']
-            f.seek(pos + code[c] * 128 + 2, 0)
-
-            chan = np.append(chan, f.read(6).decode('utf-8').strip())
-            logical_min, logical_max, logic_ground_chan, physical_min, \
-                physical_max = read_f(f, 'iiiii')
-
-            logical_ground = np.append(logical_ground, logic_ground_chan)
-
-            gain = np.append(gain, float(physical_max - physical_min) /
-                             float(logical_max - logical_min + 1))
+        # Read the whole LABCOD zone once and decode the 128-byte channel
+        # entries in a vectorized fashion instead of seeking per channel :
+        labcod = np.dtype([('status', 'V2'), ('label', 'S6'),
+                           ('logical_min', '<i4'), ('logical_max', '<i4'),
+                           ('logical_ground', '<i4'), ('physical_min', '<i4'),
+                           ('physical_max', '<i4'), ('pad', 'V100')])
+        zname2, pos, length = zones['LABCOD']
+        f.seek(pos, 0)
+        buf = f.read(length)
+        entries = np.frombuffer(buf, dtype=labcod,
+                                count=len(buf) // labcod.itemsize)[code]
 
-    # Multiply by gain
-    m_raw = m_raw - logical_ground[:, np.newaxis]
-    data = m_raw * gain[:, np.newaxis].astype(np.float32)
+        chan = [lab.decode('latin-1').strip() for lab in
+                entries['label'].tolist()]
+        logical_ground = entries['logical_ground']
+        gain = (entries['physical_max'] - entries['physical_min']) / \
+            (entries['logical_max'] - entries['logical_min'] + 1.)
 
     # Get original signal length :
-    n = data.shape[1]
+    n = m_raw.shape[1]
 
     # Get down-sample factor :
     sf = float(sf)
-    chan = list(chan)
     dsf, downsample = get_dsf(downsample, sf)
 
-    return sf, downsample, dsf, data[:, ::dsf], chan, n, start_time, None
+    # Remove logical ground, multiply by gain and decimate (with
+    # anti-alias filtering) :
+    data = _apply_gain(m_raw, gain, ground=logical_ground, dsf=dsf)
+
+    return sf, downsample, dsf, data, chan, n, start_time, None
 
 
-def read_bva(path, downsample, read_markers=False):
+def read_bva(path, downsample, read_markers=False, t_start=0., t_stop=None):
     """Read data from a BrainVision (*.vhdr) file.
 
     Poor man's version of https: // gist.github.com / breuderink / 6266871
@@ -444,6 +575,10 @@ def read_bva(path, downsample, read_markers=False):
         Down-sampling frequency.
     read_markers : bool | False
         Import markers from the .vmrk files as annotations
+    t_start : float | 0.
+        Starting time (in seconds) of the data to load.
+    t_stop : float | None
+        Ending time (in seconds) of the data to load.
 
     Returns
     -------
@@ -463,19 +598,20 @@ def read_bva(path, downsample, read_markers=False):
     import re
 
     assert os.path.isfile(path)
+    dirname = os.path.dirname(path)
 
     # Read header
-    ent = np.genfromtxt(path, delimiter='\n', usecols=[0],
-                        dtype=None, skip_header=0, encoding='utf-8')
+    with io.open(path, 'r', encoding='utf-8') as f:
+        ent = [line.strip() for line in f if line.strip()]
 
     for item in ent:
         if 'DataFile=' in item:
             data_file = item.split('=')[1]
-            data_path = os.path.join(os.path.dirname(path), data_file)
+            data_path = os.path.join(dirname, data_file)
             assert os.path.isfile(data_path)
         elif 'MarkerFile=' in item:
             marker_file = item.split('=')[1]
-            marker_path = os.path.join(os.path.dirname(path), marker_file)
+            marker_path = os.path.join(dirname, marker_file)
         elif 'NumberOfChannels=' in item:
             n_chan = int(re.findall('\d+', item)[0])
         elif 'SamplingInterval=' in item:
@@ -494,20 +630,23 @@ def read_bva(path, downsample, read_markers=False):
     assert "MULTIPLEXED" in data_orient
 
     # Extract channel labels and resolution
-    start_label = np.array(np.where(np.char.find(ent, 'Ch1=') == 0)).min()
-    chan = {}
-    resolution = np.empty(shape=n_chan)
+    start_label = next(idx for idx, item in enumerate(ent)
+                       if item.startswith('Ch1='))
 
-    for i, j in enumerate(range(start_label, start_label + n_chan)):
-        chan[i] = re.split('\W+', ent[j])[1]
-        resolution[i] = float(ent[j].split(",")[2])
+    # Channel lines look like 'ChN=label,reference,resolution,unit' :
+    # parse the whole block with a single compiled regex instead of one
+    # re.split call per channel :
+    pat = re.compile(r'Ch\d+=([^,]+),[^,]*,([-\d.eE+]+)')
+    matches = pat.findall('\n'.join(ent[start_label:start_label + n_chan]))
+    assert len(matches) == n_chan
 
-    chan = np.array(list(chan.values())).flatten()
+    chan = [m[0] for m in matches]
+    resolution = np.array([float(m[1]) for m in matches])
 
     # Read marker file (if present) to extract recording time
     if os.path.isfile(marker_path):
-        vmrk = np.genfromtxt(marker_path, delimiter='\n', usecols=[0],
-                             dtype=None, skip_header=0, encoding='utf-8')
+        with io.open(marker_path, 'r', encoding='utf-8') as f:
+            vmrk = [line.strip() for line in f if line.strip()]
 
         # Read start-time
         for item in vmrk:
@@ -536,27 +675,26 @@ def read_bva(path, downsample, read_markers=False):
         else:
             anot = None
 
-    with io.open(data_path, 'rb') as f:
-        raw = f.read()
-        size = int(len(raw) / 2)
-
-        ints = np.ndarray((n_chan, int(size / n_chan)),
-                          dtype='<i2', order='F', buffer=raw)
-
-        data = np.float32(np.diag(resolution)).dot(ints)
-
-    # Get original signal length :
-    n = data.shape[1]
-
     # Get down-sample factor :
     sf = float(sf)
-    chan = list(chan)
     dsf, downsample = get_dsf(downsample, sf)
 
-    return sf, downsample, dsf, data[:, ::dsf], chan, n, start_time, anot
+    # Memory-map the multiplexed int16 payload so that the page cache is
+    # the only full-rate copy (same strategy as the ELAN reader) :
+    n_samples = int(os.path.getsize(data_path) // (2 * n_chan))
+    sample_start, sample_stop = _sample_bounds(sf, n_samples, t_start, t_stop)
+    n = sample_stop - sample_start
+    ints = np.memmap(data_path, dtype='<i2', mode='r',
+                     shape=(n_chan, n_samples),
+                     order='F')[:, sample_start:sample_stop]
+
+    # Scale to float32 and decimate (with anti-alias filtering) :
+    data = _apply_gain(ints, resolution, dsf=dsf)
 
+    return sf, downsample, dsf, data, chan, n, start_time, anot
 
-def read_elan(path, downsample):
+
+def read_elan(path, downsample, t_start=0., t_stop=None):
     """Read data from a ELAN (eeg) file.
 
     Elan format specs: http: // elan.lyon.inserm.fr/
@@ -567,6 +705,10 @@ def read_elan(path, downsample):
         Filename(with full path) to Elan .eeg file
     downsample : int
         Down-sampling frequency.
+    t_start : float | 0.
+        Starting time (in seconds) of the data to load.
+    t_stop : float | None
+        Ending time (in seconds) of the data to load.
 
     Returns
     -------
@@ -588,9 +730,10 @@ def read_elan(path, downsample):
     assert os.path.isfile(path)
     assert os.path.isfile(header)
 
-    # Read .ent file
-    ent = np.genfromtxt(header, delimiter='\n', usecols=[0],
-                        dtype=None, skip_header=0, encoding='utf-8')
+    # Read .ent file (plain text, one entry per line). np.genfromtxt runs
+    # a type-sniffing parser per line and is needlessly slow here :
+    with io.open(header, 'r', encoding='utf-8') as f:
+        ent = [line.strip() for line in f if line.strip()]
 
     # eeg file version
     eeg_version = ent[0]
@@ -614,50 +757,50 @@ def read_elan(path, downsample):
         start_time = datetime.time(0, 0, 0)
 
     # Channels
-    nb_chan = np.int(ent[9])
-    nb_chan = nb_chan
+    nb_chan = int(ent[9])
 
     # Last 2 channels do not contain data
     nb_chan_data = nb_chan - 2
-    chan_list = slice(nb_chan_data)
     chan = ent[10:10 + nb_chan_data]
 
     # Gain
-    gain = np.zeros(nb_chan)
     offset1 = 9 + 3 * nb_chan
     offset2 = 9 + 4 * nb_chan
     offset3 = 9 + 5 * nb_chan
     offset4 = 9 + 6 * nb_chan
 
-    for i in np.arange(1, nb_chan + 1):
-
-        min_an = float(ent[offset1 + i])
-        max_an = float(ent[offset2 + i])
-        min_num = float(ent[offset3 + i])
-        max_num = float(ent[offset4 + i])
+    min_an = np.asarray(ent[offset1 + 1:offset1 + 1 + nb_chan],
+                        dtype=np.float64)
+    max_an = np.asarray(ent[offset2 + 1:offset2 + 1 + nb_chan],
+                        dtype=np.float64)
+    min_num = np.asarray(ent[offset3 + 1:offset3 + 1 + nb_chan],
+                         dtype=np.float64)
+    max_num = np.asarray(ent[offset4 + 1:offset4 + 1 + nb_chan],
+                         dtype=np.float64)
 
-        gain[i - 1] = (max_an - min_an) / (max_num - min_num)
-    if gain.dtype != np.float32:
-        gain = gain.astype(np.float32, copy=False)
+    gain = (max_an - min_an) / (max_num - min_num)
 
     # Load memmap
     nb_bytes = os.path.getsize(path)
     nb_samples = int(nb_bytes / (nb_oct * nb_chan))
 
+    sample_start, sample_stop = _sample_bounds(sf, nb_samples, t_start,
+                                               t_stop)
     m_raw = np.memmap(path, dtype=formread, mode='r',
-                      shape=(nb_chan, nb_samples), order={'F'})
+                      shape=(nb_chan, nb_samples),
+                      order='F')[:, sample_start:sample_stop]
 
     # Get original signal length :
     n = m_raw.shape[1]
 
     # Get down-sample factor :
     sf = float(sf)
-    chan = list(chan)
     dsf, downsample = get_dsf(downsample, sf)
 
-    # Multiply by gain :
-    data = m_raw[chan_list, ::dsf] * \
-        gain[chan_list][..., np.newaxis]
+    # Multiply by gain and decimate (with anti-alias filtering), one
+    # channel at a time so that only the decimated float32 copy is ever
+    # materialized :
+    data = _apply_gain(m_raw[:nb_chan_data], gain[:nb_chan_data], dsf=dsf)
 
     return sf, downsample, dsf, data, chan, n, start_time, None
 
@@ -129,19 +129,13 @@ def oversample_hypno(hypno, n):
         The hypnogram of shape (n,)
     """
     # Get the repetition number :
-    rep_nb = int(np.round(n / len(hypno)))
+    rep_nb = max(int(np.round(n / len(hypno))), 1)
 
-    # Repeat hypnogram :
-    hypno = np.repeat(hypno, rep_nb)
-    npts = len(hypno)
+    # Fill the output in a single pass : sample i maps onto
+    # hypno[i // rep_nb], holding the last stage past the end :
+    idx = np.minimum(np.arange(n) // rep_nb, len(hypno) - 1)
 
-    # Check size
-    if npts < n:
-        hypno = np.append(hypno, hypno[-1] * np.ones((n - npts)))
-    elif npts > n:
-        hypno = hypno[0:n]
-
-    return hypno.astype(int)
+    return hypno[idx].astype(int)
 
 
 ###############################################################################
@@ -181,8 +175,8 @@ def write_hypno(filename, hypno, version='time', sf=100., npts=1, window=1.,
     _, ext = os.path.splitext(filename)
     # Switch between time and sample version :
     if version is 'sample':  # v1 = sample
-        # Take a down-sample version of the hypno :
-        step = int(len(hypno) / np.round(npts / sf))
+        # Take a down-sample version of the hypno (one value per second) :
+        step = max(int(round(len(hypno) / (npts / sf))), 1)
         hypno = hypno[::step].astype(int)
         # Export :
         if ext == '.txt':
@@ -232,13 +226,16 @@ def _write_hypno_txt_sample(filename, hypno, window=1.):
     descript = os.path.join(dirname, os.path.splitext(
         base)[0] + '_description.txt')
 
-    # Save hypno
-    np.savetxt(filename, hypno, fmt='%s')
+    # Save hypno (one '\n'.join + write instead of the per-row string
+    # formatting of np.savetxt) :
+    with open(filename, 'w') as f:
+        f.write('\n'.join(str(k) for k in hypno.tolist()) + '\n')
 
     # Save header file
-    hdr = np.array([['time ' + str(window)], ['W 0'], ['N1 1'], ['N2 2'],
-                    ['N3 3'], ['REM 4'], ['Art -1']]).flatten()
-    np.savetxt(descript, hdr, fmt='%s')
+    hdr = ['time ' + str(window), 'W 0', 'N1 1', 'N2 2', 'N3 3', 'REM 4',
+           'Art -1']
+    with open(descript, 'w') as f:
+        f.write('\n'.join(hdr) + '\n')
 
 
 def _write_hypno_hyp_sample(filename, hypno, sf=100., npts=1):
@@ -257,14 +254,15 @@ def _write_hypno_hyp_sample(filename, hypno, sf=100., npts=1):
     """
     hypno[hypno == 4] = 5
 
-    hdr = np.array([['time_base 1.000000'],
-                    ['sampling_period ' + str(np.round(1 / sf, 8))],
-                    ['epoch_nb ' + str(int(npts / sf))],
-                    ['epoch_list']]).flatten()
+    hdr = ['time_base 1.000000',
+           'sampling_period ' + str(np.round(1 / sf, 8)),
+           'epoch_nb ' + str(int(npts / sf)),
+           'epoch_list']
 
     # Save
-    export = np.append(hdr, hypno.astype(str))
-    np.savetxt(filename, export, fmt='%s')
+    export = hdr + [str(k) for k in hypno.tolist()]
+    with open(filename, 'w') as f:
+        f.write('\n'.join(export) + '\n')
 
 
 ###############################################################################
@@ -348,14 +346,15 @@ def _read_hypno_hyp_sample(path):
     sf_hyp : float
         The hypnogram original sampling frequency (Hz)
     """
-    hyp = np.genfromtxt(path, delimiter='\n', usecols=[0],
-                        dtype=None, skip_header=0, encoding='utf-8')
+    with open(path, 'r', encoding='utf-8') as f:
+        hyp = [line.strip() for line in f if line.strip()]
 
     # Get sampling frequency of hypnogram
     sf_hyp = 1 / float(hyp[0].split()[1])
 
-    # Extract hypnogram values
-    hypno = np.array(hyp[4:], dtype=np.int)
+    # Extract hypnogram values (int8 is plenty for the [-1, 4] range and
+    # cuts memory traffic on every downstream pass) :
+    hypno = np.array(hyp[4:], dtype=np.int8)
 
     # Replace values according to Iber et al 2007
     hypno[hypno == -2] = -1
@@ -388,24 +387,22 @@ def _read_hypno_txt_sample(path):
     assert os.path.isfile(header)
 
     # Load header file
-    labels = np.genfromtxt(header, dtype=str, delimiter=" ", usecols=0,
-                           encoding='utf-8')
-    values = np.genfromtxt(header, dtype=float, delimiter=" ", usecols=1,
-                           encoding='utf-8')
-    desc = {label: row for label, row in zip(labels, values)}
+    desc = {}
+    with open(header, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                label, value = line.split()[:2]
+                desc[label] = float(value)
 
     # Get sampling frequency of hypnogram
     sf_hyp = 1. / float(desc['time'])
 
     # Load hypnogram file
-    hyp = np.genfromtxt(path, delimiter='\n', usecols=[0],
-                        dtype=None, skip_header=0, encoding='utf-8')
+    with open(path, 'r', encoding='utf-8') as f:
+        hyp = [line.strip() for line in f if line.strip()]
 
-    if not np.issubdtype(hyp.dtype, np.integer):
-        hypno = np.array([s for s in hyp if s.lstrip('-').isdigit()],
-                         dtype=int)
-    else:
-        hypno = hyp.astype(int)
+    hypno = np.array([s for s in hyp if s.lstrip('-').isdigit()],
+                     dtype=int)
 
     hypno = swap_hyp_values(hypno, desc)
 
@@ -535,6 +532,12 @@ def _read_hypno_edf_sample(hypno_file_path, data_file_path):
     return hypno_s, sf_hyp
 
 
+# Canonical mapping between stage names found in description files and the
+# Iber et al. 2007 values used by Sleep :
+_STAGE_VALUES = {'Art': -1, 'Nde': -1, 'Mt': -1, 'W': 0, 'N1': 1, 'N2': 2,
+                 'N3': 3, 'N4': 3, 'REM': 4}
+
+
 def swap_hyp_values(hypno, desc):
     """Swap values in hypnogram vector.
 
@@ -562,26 +565,21 @@ def swap_hyp_values(hypno, desc):
     hypno_s : array_like
         Hypnogram with swapped values
     """
-    # Swap values
-    hypno_s = -1 * np.ones(shape=(hypno.shape), dtype=int)
-
-    if 'Art' in desc:
-        hypno_s[hypno == desc['Art']] = -1
-    if 'Nde' in desc:
-        hypno_s[hypno == desc['Nde']] = -1
-    if 'Mt' in desc:
-        hypno_s[hypno == desc['Mt']] = -1
-    if 'W' in desc:
-        hypno_s[hypno == desc['W']] = 0
-    if 'N1' in desc:
-        hypno_s[hypno == desc['N1']] = 1
-    if 'N2' in desc:
-        hypno_s[hypno == desc['N2']] = 2
-    if 'N3' in desc:
-        hypno_s[hypno == desc['N3']] = 3
-    if 'N4' in desc:
-        hypno_s[hypno == desc['N4']] = 3
-    if 'REM' in desc:
-        hypno_s[hypno == desc['REM']] = 4
+    pairs = [(int(desc[key]), val) for key, val in _STAGE_VALUES.items()
+             if key in desc]
+
+    if not pairs:
+        return np.full(hypno.shape, -1, dtype=np.int8)
+
+    # Build a lookup table with a guard slot on each side, so that any
+    # value outside the described range falls onto -1 :
+    old_vals = [old for old, _ in pairs]
+    vmin = min(old_vals)
+    lut = np.full(max(old_vals) - vmin + 3, -1, dtype=np.int8)
+    for old, new in pairs:
+        lut[old - vmin + 1] = new
+
+    # Swap values in a single pass :
+    hypno_s = lut[np.clip(hypno - vmin + 1, 0, len(lut) - 1)]
 
     return hypno_s